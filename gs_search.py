@@ -17,15 +17,19 @@ a .csv file.
 """
 
 import requests, os, datetime, argparse
-from bs4 import BeautifulSoup
-import matplotlib.pyplot as plt
-import pandas as pd
+import asyncio
+import atexit
+import aiohttp
+from selectolax.parser import HTMLParser
 from time import sleep
+from urllib.parse import urlencode
 import warnings
 import logging
-from urllib.request import urlretrieve
+import shutil
 import re
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 # set logger
 logging.basicConfig(level=logging.DEBUG)
@@ -51,16 +55,25 @@ ENDYEAR = now.year  # Current year
 DEBUG = False  # debug mode
 
 # Websession Parameters
-ARCHIVE_URL = 'https://web.archive.org/web/20210314203256/' + 'https://scholar.google.com/scholar?start={}&q={}&hl=en&as_sdt=0,5'
-GSCHOLAR_URL = 'https://scholar.google.com/scholar?start={}&as_q={}&hl=en&as_sdt=0,5'
+GSCHOLAR_BASE_URL = 'https://scholar.google.com/scholar'
+ARCHIVE_PREFIX = 'https://web.archive.org/web/20210314203256/'
+ROBOT_KW = ['unusual traffic from your computer network', 'not a robot']
+# Bytes-level sentinel scan so robot detection never decodes the page body
+_ROBOT_RE = re.compile(b'|'.join(re.escape(kw.encode('ISO-8859-1')) for kw in ROBOT_KW))
+GSCHOLAR_PROXY = 'http://127.0.0.1:1087'
 
-# YEAR_RANGE = '&as_ylo={}&as_yhi={}'
-AS_PUBLICATION_URL = '&as_publication={}'
+# Compiled patterns so the hot per-result scans run in C instead of
+# char-by-char Python loops
+_CITED_RE = re.compile(r'Cited by (\d+)')
+_YEAR_RE = re.compile(r'(\d{4})\s*-')
+_AUTHOR_RE = re.compile(r'^(.*?)\s*-')
 
-# GSCHOLAR_URL_YEAR = GSCHOLAR_URL+YEAR_RANGE
-STARTYEAR_URL = '&as_ylo={}'
-ENDYEAR_URL = '&as_yhi={}'
-ROBOT_KW = ['unusual traffic from your computer network', 'not a robot']
+# Shared session: keep-alive and a pooled adapter so page fetches and PDF
+# downloads reuse the same TCP/TLS connections instead of reconnecting
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=3))
+SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'})
 
 
 def get_command_line_args():
@@ -137,27 +150,24 @@ def get_command_line_args():
 
 
 def get_citations(content):
-    out = 0
-    for char in range(0, len(content)):
-        if content[char:char + 9] == 'Cited by ':
-            init = char + 9
-            for end in range(init + 1, init + 6):
-                if content[end] == '<':
-                    break
-            out = content[init:end]
-    return int(out)
+    match = _CITED_RE.search(content)
+    return int(match.group(1)) if match else 0
 
 
 def get_year(content):
-    for char in range(0, len(content)):
-        if content[char] == '-':
-            out = content[char - 5:char - 1]
-    if not out.isdigit():
-        out = 0
-    return int(out)
+    match = _YEAR_RE.search(content)
+    return int(match.group(1)) if match else 0
+
+
+# Single Chrome instance shared across all selenium fallbacks
+_driver = None
 
 
 def setup_driver():
+    global _driver
+    if _driver is not None:
+        return _driver
+
     try:
         from selenium import webdriver
         from selenium.webdriver.chrome.options import Options
@@ -169,35 +179,55 @@ def setup_driver():
     print('Loading...')
     chrome_options = Options()
     chrome_options.add_argument("disable-infobars")
-    driver = webdriver.Chrome(chrome_options=chrome_options)
-    return driver
+    # Keep the window visible: this driver exists so the user can solve
+    # captchas manually. Only image loading is skipped to save network
+    chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+    _driver = webdriver.Chrome(options=chrome_options)
+    atexit.register(_driver.quit)
+    return _driver
 
 
 def get_author(content):
-    for char in range(0, len(content)):
-        if content[char] == '-':
-            out = content[2:char - 1]
-            break
-    return out
+    match = _AUTHOR_RE.search(content)
+    return match.group(1) if match else content
 
 
-def get_element(driver, xpath, attempts=5, _count=0):
+def get_element(driver, xpath, attempts=5):
     '''Safe get_element method with multiple attempts'''
-    try:
-        element = driver.find_element_by_xpath(xpath)
-        return element
-    except Exception as e:
-        if _count < attempts:
+    from selenium.webdriver.common.by import By
+
+    for _ in range(attempts):
+        try:
+            return driver.find_element(By.XPATH, xpath)
+        except Exception:
             sleep(1)
-            get_element(driver, xpath, attempts=attempts, _count=_count + 1)
-        else:
-            print("Element not found")
+    print("Element not found")
+    return None
+
+
+async def fetch_page(session, semaphore, url, debug=False):
+    '''Fetch one results page, throttled by the shared semaphore'''
+    async with semaphore:
+        if debug:
+            print("Opening URL:", url)
+        async with session.get(url, proxy=GSCHOLAR_PROXY) as response:
+            body = await response.read()
+        # Keep the politeness delay inside the slot so at most one
+        # request per slot fires every 0.5s
+        await asyncio.sleep(0.5)
+        return body
+
+
+async def fetch_pages(urls, debug=False):
+    '''Fetch all results pages concurrently, preserving order'''
+    semaphore = asyncio.Semaphore(3)
+    connector = aiohttp.TCPConnector(limit=4)
+    async with aiohttp.ClientSession(connector=connector, headers=dict(SESSION.headers)) as session:
+        return await asyncio.gather(*[fetch_page(session, semaphore, url, debug=debug) for url in urls])
 
 
 def get_content_with_selenium(url):
-    if 'driver' not in globals():
-        global driver
-        driver = setup_driver()
+    driver = setup_driver()
     driver.get(url)
 
     # Get element from page
@@ -216,52 +246,42 @@ def main():
     # Get command line arguments
     keyword, number_of_results, save_database, path, sortby_column, plot_results, start_year, end_year, debug, archive, publication, enable_download = get_command_line_args()
 
-    # Create main URL based on command line arguments
-    if archive:
-        GSCHOLAR_MAIN_URL = ARCHIVE_URL
-    else:
-        GSCHOLAR_MAIN_URL = GSCHOLAR_URL
+    # Compute the keyword encoding used in output filenames once
+    kw_fname = keyword.replace(' ', '_')
+
+    # Build the query string once from command line arguments; urlencode
+    # handles the keyword escaping, and only the start index varies per page
+    params = {'q' if archive else 'as_q': keyword, 'hl': 'en', 'as_sdt': '0,5'}
 
     # select the source
     if publication != "all" and publication:
-        GSCHOLAR_MAIN_URL = GSCHOLAR_MAIN_URL + AS_PUBLICATION_URL.format(publication)
+        params['as_publication'] = publication
 
     if start_year:
-        GSCHOLAR_MAIN_URL = GSCHOLAR_MAIN_URL + STARTYEAR_URL.format(start_year)
+        params['as_ylo'] = start_year
 
     if end_year != now.year:
-        GSCHOLAR_MAIN_URL = GSCHOLAR_MAIN_URL + ENDYEAR_URL.format(end_year)
+        params['as_yhi'] = end_year
+
+    query = urlencode(params)
+    base_url = (ARCHIVE_PREFIX if archive else '') + GSCHOLAR_BASE_URL
 
     if debug:
-        logger.info(f"DEBUG_GSCHOLAR_MAIN_URL: {GSCHOLAR_MAIN_URL}")
-
-    # Start new session
-    session = requests.Session()
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'}
-
-    # Variables
-    links = []
-    title = []
-    citations = []
-    year = []
-    author = []
-    rank = [0]
-
-    # Get content from number_of_results URLs
-    for n in range(0, number_of_results, 10):
-        # if start_year is None:
-        url = GSCHOLAR_MAIN_URL.format(str(n), keyword.replace(' ', '+'))
-        if debug:
-            print("Opening URL:", url)
-        # else:
-        #    url=GSCHOLAR_URL_YEAR.format(str(n), keyword.replace(' ','+'), start_year=start_year, end_year=end_year)
-
-        print("Loading next {} results".format(n + 10))
-        page = session.get(url, proxies={'http': 'http://127.0.0.1:1087',
-                                         'https': 'http://127.0.0.1:1087'})  # , headers=headers)
-        c = page.content
-        if any(kw in c.decode('ISO-8859-1') for kw in ROBOT_KW):
+        logger.info(f"DEBUG_GSCHOLAR_MAIN_URL: {base_url}?{query}")
+
+    # One record per result; pandas builds the columns in a single pass
+    records = []
+
+    # Fetch the number_of_results URLs concurrently, then parse in order
+    urls = [f'{base_url}?start={n}&{query}'
+            for n in range(0, number_of_results, 10)]
+    print("Loading {} results".format(len(urls) * 10))
+    bodies = asyncio.run(fetch_pages(urls, debug=debug))
+
+    empty_pages = 0
+    delay = 1.0
+    for url, c in zip(urls, bodies):
+        if _ROBOT_RE.search(c):
             print("Robot checking detected, handling with selenium (if installed)")
             try:
                 c = get_content_with_selenium(url)
@@ -269,68 +289,94 @@ def main():
                 print("No success. The following error was raised:")
                 print(e)
 
-        # Create parser
-        soup = BeautifulSoup(c, 'html.parser')
+        # Create parser; selectolax takes the raw bytes, so the body is
+        # never copied into a str
+        tree = HTMLParser(c)
 
         # Get stuff
-        mydivs = soup.findAll("div", {"class": "gs_r"})
+        mydivs = tree.css('div.gs_r')
+
+        # No results usually means Scholar is throttling us; back off
+        # instead of hammering it via the selenium refetch path
+        if not mydivs:
+            empty_pages += 1
+            if empty_pages >= 3:
+                logger.warning('3 empty result pages in a row, stopping early')
+                break
+            delay = min(delay * 2, 60)
+            sleep(delay)
+            continue
+        empty_pages = 0
+        delay = 1.0
 
         for div in mydivs:
+            # Walk to each node once and reuse it for every field
+            h3a = div.css_first('h3 a')
+            gsa = div.css_first('div.gs_a')
+            gsa_text = gsa.text() if gsa is not None else ''
+            cite_a = div.css_first('a[href*="cites="]')
+
             try:
-                links.append(div.find('h3').find('a').get('href'))
+                link = h3a.attributes.get('href')
             except:  # catch *all* exceptions
-                links.append('Look manually at: ' + url)
+                link = 'Look manually at: ' + url
 
             try:
-                title.append(div.find('h3').find('a').text)
+                title = h3a.text()
             except:
-                title.append('Could not catch title')
+                title = 'Could not catch title'
 
             try:
-                citations.append(get_citations(str(div.format_string)))
+                citations = get_citations(cite_a.text())
             except:
-                warnings.warn("Number of citations not found for {}. Appending 0".format(title[-1]))
-                citations.append(0)
+                warnings.warn("Number of citations not found for {}. Appending 0".format(title))
+                citations = 0
 
             try:
-                year.append(get_year(div.find('div', {'class': 'gs_a'}).text))
+                year = get_year(gsa_text)
             except:
-                warnings.warn("Year not found for {}, appending 0".format(title[-1]))
-                year.append(0)
+                warnings.warn("Year not found for {}, appending 0".format(title))
+                year = 0
 
             try:
-                author.append(get_author(div.find('div', {'class': 'gs_a'}).text))
+                author = get_author(gsa_text)
             except:
-                author.append("Author not found")
+                author = "Author not found"
 
-            rank.append(rank[-1] + 1)
+            records.append({'Author': author, 'Title': title, 'Citations': citations,
+                            'Year': year, 'Source': link})
 
-        # Delay 
-        sleep(0.5)
+    # Imported lazily so plain fetch runs don't pay the cold-start cost
+    import numpy as np
+    import pandas as pd
 
     # Create a dataset and sort by the number of citations
-    data = pd.DataFrame(list(zip(author, title, citations, year, links)), index=rank[1:],
-                        columns=['Author', 'Title', 'Citations', 'Year', 'Source'])
-    data.index.name = 'Rank'
+    data = pd.DataFrame.from_records(records, columns=['Author', 'Title', 'Citations', 'Year', 'Source'])
+    data.index = pd.RangeIndex(1, len(records) + 1, name='Rank')
 
-    # Add columns with number of citations per year
-    data['cit/year'] = data['Citations'] / (end_year + 1 - data['Year'])
-    data['cit/year'] = data['cit/year'].round(0).astype(int)
+    # Add columns with number of citations per year; clip the denominator
+    # so Year==0 rows don't divide by zero
+    denom = np.maximum(end_year + 1 - data['Year'].to_numpy(), 1)
+    data['cit/year'] = np.rint(data['Citations'].to_numpy() / denom).astype(np.int32)
 
-    # Sort by the selected columns, if exists
+    # Sort by the selected columns, if exists. The key is always numeric,
+    # so argsort on the raw array beats the pandas object-dtype sort path
     try:
-        data_ranked = data.sort_values(by=sortby_column, ascending=False)
+        key = data[sortby_column].to_numpy()
     except Exception as e:
         print('Column name to be sorted not found. Sorting by the number of citations...')
-        data_ranked = data.sort_values(by='Citations', ascending=False)
         print(e)
+        key = data['Citations'].to_numpy()
+    order = np.argsort(key, kind='stable')[::-1]
+    data_ranked = data.iloc[order]
 
     # Print data
     print(data_ranked)
 
     # Plot by citation number
     if plot_results:
-        plt.plot(rank[1:], citations, '*')
+        import matplotlib.pyplot as plt
+        plt.plot(data.index, data['Citations'], '*')
         plt.ylabel('Number of Citations')
         plt.xlabel('Rank of the keyword on Google Scholar')
         plt.title('Keyword: ' + keyword)
@@ -338,32 +384,36 @@ def main():
 
     # Save results
     if save_database:
-        data_ranked.to_csv(os.path.join(path, keyword.replace(' ', '_') + '.csv'), encoding='utf-8')  # Change the path
+        data_ranked.to_csv(os.path.join(path, kw_fname + '.csv'), encoding='utf-8')  # Change the path
 
     # download PDFs
     if enable_download:
         logger.info('downloading ...')
-        outputdir = './papers_{}'.format(keyword.replace(' ', '_'))
+        outputdir = './papers_{}'.format(kw_fname)
         if not os.path.exists(outputdir):
             os.mkdir(outputdir)
 
-        for index, row in data_ranked.iterrows():
-            logger.info(f"downloading {row}")
-            pdf_url = row['Source']
-            filename = "{}_{}_{}.pdf".format(
-                row['Citations'],
-                row['Year'],
-                row['Title'],
-            )
-            if not isValidUrl(pdf_url):
-                continue
-            try:
-                download_pdf(pdf_url, dirpath=outputdir, filename=filename)
-            except Exception as e:
-                logger.error('error_on_download_pdf')
-                logger.exception(e)
-                logger.debug(traceback.format_exc())
-                traceback.print_exc()
+        # Downloads are pure I/O wait, so overlap them on the pooled session;
+        # itertuples avoids materializing a Series per row
+        rows = data_ranked[['Citations', 'Year', 'Title', 'Source']].itertuples(index=False, name=None)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda row: _safe_download(row, outputdir), rows))
+
+def _safe_download(row, outputdir):
+    '''Download one (citations, year, title, source) result, logging instead of raising on failure'''
+    citations, year, title, pdf_url = row
+    logger.info(f"downloading {title}")
+    filename = "{}_{}_{}.pdf".format(citations, year, title)
+    if not isValidUrl(pdf_url):
+        return
+    try:
+        download_pdf(pdf_url, dirpath=outputdir, filename=filename)
+    except Exception as e:
+        logger.error('error_on_download_pdf')
+        logger.exception(e)
+        logger.debug(traceback.format_exc())
+        traceback.print_exc()
+
 
 def isValidUrl(url):
     if 'Look manually at' in url:
@@ -380,9 +430,18 @@ def download_pdf(pdf_url, dirpath: str = './', filename: str = '') -> str:
     if not filename:
         logger.error(f'{pdf_url} has no filename')
         return
+    # Paper titles can contain '/' and easily exceed the 255-byte name limit
+    filename = filename.replace('/', '_')
+    if len(filename.encode('utf-8')) > 255:
+        stem, ext = os.path.splitext(filename)
+        max_stem = 255 - len(ext.encode('utf-8'))
+        filename = stem.encode('utf-8')[:max_stem].decode('utf-8', 'ignore') + ext
     path = os.path.join(dirpath, filename)
-    written_path, _ = urlretrieve(pdf_url, path)
-    return written_path
+    with SESSION.get(pdf_url, stream=True, timeout=30) as r:
+        r.raise_for_status()
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(r.raw, f, length=1 << 16)
+    return path
 
 
 if __name__ == '__main__':